@@ -1,18 +1,39 @@
 import argparse
 import boto3
 import botocore
+from concurrent.futures import ThreadPoolExecutor
 import datetime
-from jinja2 import Environment, FileSystemLoader
+import functools
+import hashlib
+import io
+from jinja2 import Environment
 import json
 import os
 import ruamel.yaml
+import time
 
 RESOURCES = ['workspace',
-             'ec2'
+             'ec2',
+             'coordinator'
              ]
 
 DIR_PATH = os.path.dirname(os.path.realpath(__file__))
 
+JINJA_ENV = Environment()
+
+# Stack tag holding the hash of the template and parameters it was last deployed with
+TEMPLATE_HASH_TAG = 'itglue-template-hash'
+
+NO_CHANGES_MESSAGES = [
+    "The submitted information didn't contain changes.",
+    'No updates are to be performed.'
+]
+
+# Only a stack in one of these states is known to be running its tagged template
+DEPLOYED_STATUSES = ['CREATE_COMPLETE', 'UPDATE_COMPLETE']
+
+MAX_PARALLEL_DEPLOYS = 10
+
 
 class CfnError(Exception):
     pass
@@ -25,29 +46,38 @@ def _load_yaml_files(stack_name, resource_list):
     a Lambda function, specific role and policy
 
     base.yaml - contains all the basic details and resources required of a Cloudformation
+
+    The template is written to cfn_template_<hash>.yml, named after its content,
+    so an unchanged template is not written again. Returns the template body.
     """
     yaml = ruamel.yaml.YAML()
-    with open(f'{DIR_PATH}/templates/base.yaml') as base:
-        base_cfn = yaml.load(base)
+    base_cfn = yaml.load(_read_template('base'))
     for resource in resource_list:
         function_name = f'{stack_name}{resource}SyncFunction'
-        with open(f'{DIR_PATH}/templates/{resource}.yaml', 'r') as file:
-            new_file = _update_resource_function_name(resource, function_name)
-            resource_template = yaml.load(new_file)
-            updated_template = _load_resources(base_cfn, resource_template['Resources'])
-            print(f'{resource} template added')
-    today_date = str(datetime.datetime.now())
-    with open(f'{DIR_PATH}/cfn_template_{today_date}.yml', 'w') as cfn_template:
-        yaml.dump(updated_template, cfn_template)
-    print('Cloudformation template created')
-    return cfn_template.name
+        resource_template = yaml.load(_update_resource_function_name(resource, function_name))
+        _load_resources(base_cfn, resource_template['Resources'])
+        print(f'{resource} template added')
+    stream = io.StringIO()
+    yaml.dump(base_cfn, stream)
+    template_body = stream.getvalue()
+    template_path = f'{DIR_PATH}/cfn_template_{_hash(template_body)[:12]}.yml'
+    if not os.path.isfile(template_path):
+        with open(template_path, 'w') as cfn_template:
+            cfn_template.write(template_body)
+    print(f'Cloudformation template created: {template_path}')
+    return template_body
+
+
+@functools.lru_cache(maxsize=None)
+def _read_template(resource):
+    with open(f'{DIR_PATH}/templates/{resource}.yaml', 'r') as file:
+        return file.read()
 
 
+@functools.lru_cache(maxsize=None)
 def _update_resource_function_name(resource, function_name):
-    env = Environment(loader=FileSystemLoader(DIR_PATH))
-    template = env.get_template(f'templates/{resource}.yaml')
-    updated_file = template.render(functionName=function_name)
-    return updated_file
+    template = JINJA_ENV.from_string(_read_template(resource))
+    return template.render(functionName=function_name)
 
 
 def _load_resources(base_cfn, yaml_properties):
@@ -58,38 +88,85 @@ def _load_resources(base_cfn, yaml_properties):
 
 
 def _update_or_create_stack(cf, cfn_params, stack_name):
-    """Creates a Cloudformation stack or updates an existing stack of the same name"""
-    try:
-        if _stack_exists(cf, stack_name):
-            print(f'Updating {stack_name}')
-            stack_result = cf.update_stack(**cfn_params)
-            waiter = cf.get_waiter('stack_update_complete')
-        else:
-            print(f'Creating {stack_name}')
-            stack_result = cf.create_stack(**cfn_params)
-            waiter = cf.get_waiter('stack_create_complete')
-        print("Waiting for stack to be ready...")
-        waiter.wait(StackName=stack_name)
-    except botocore.exceptions.ClientError as error:
-        error_message = error.response['Error']['Message']
-        if error_message == 'No updates are to be performed.':
-            print("No changes on the stack")
-        else:
-            raise error
+    """Creates or updates a Cloudformation stack through a change set
+
+    Skips the deploy when the stack is tagged with the hash of the same template
+    and parameters, and discards change sets that contain no changes.
+    """
+    label = f'[{cf.meta.region_name}/{stack_name}]'
+    template_hash = _template_hash(cfn_params)
+    stack = _describe_stack(cf, stack_name)
+    if stack and stack['StackStatus'] in DEPLOYED_STATUSES and _stack_template_hash(stack) == template_hash:
+        print(f'{label} Template and parameters unchanged, skipping deploy')
+        return False
+    # A stack left in REVIEW_IN_PROGRESS by an unexecuted create change set still needs a CREATE
+    if stack and stack['StackStatus'] != 'REVIEW_IN_PROGRESS':
+        change_set_type = 'UPDATE'
+        waiter_name = 'stack_update_complete'
     else:
-        complete_cfn = cf.describe_stacks(StackName=stack_name)
-        print(json.dumps(complete_cfn, indent=2, default=_json_serial))
+        change_set_type = 'CREATE'
+        waiter_name = 'stack_create_complete'
+    change_set_name = f'itglue-{template_hash[:12]}-{int(time.time())}'
+    print(f'{label} Creating {change_set_type.lower()} change set {change_set_name}')
+    cf.create_change_set(
+        ChangeSetName=change_set_name,
+        ChangeSetType=change_set_type,
+        Tags=[{'Key': TEMPLATE_HASH_TAG, 'Value': template_hash}],
+        **cfn_params
+    )
+    try:
+        cf.get_waiter('change_set_create_complete').wait(StackName=stack_name, ChangeSetName=change_set_name)
+    except botocore.exceptions.WaiterError:
+        change_set = cf.describe_change_set(StackName=stack_name, ChangeSetName=change_set_name)
+        reason = change_set.get('StatusReason', '')
+        if any(message in reason for message in NO_CHANGES_MESSAGES):
+            cf.delete_change_set(StackName=stack_name, ChangeSetName=change_set_name)
+            print(f'{label} No changes on the stack')
+            return False
+        raise CfnError(f'{label} Change set {change_set_name} failed: {reason}')
+    cf.execute_change_set(StackName=stack_name, ChangeSetName=change_set_name)
+    print(f'{label} Waiting for stack to be ready...')
+    cf.get_waiter(waiter_name).wait(StackName=stack_name)
+    complete_cfn = cf.describe_stacks(StackName=stack_name)
+    print(json.dumps(complete_cfn, indent=2, default=_json_serial))
+    return True
 
 
-def _stack_exists(cf, stack_name):
+def _describe_stack(cf, stack_name):
     try:
-        cf.describe_stacks(StackName=stack_name)
-        return True
+        return cf.describe_stacks(StackName=stack_name)['Stacks'][0]
     except botocore.exceptions.ClientError as e:
         # If the stack was not found, returns ValidationError code
         if e.response['Error']['Code'] != 'ValidationError':
             raise e
-        return False
+        return None
+
+
+def _stack_template_hash(stack):
+    for tag in stack.get('Tags', []):
+        if tag['Key'] == TEMPLATE_HASH_TAG:
+            return tag['Value']
+
+
+def _template_hash(cfn_params):
+    parameters = json.dumps(cfn_params['Parameters'], sort_keys=True)
+    return _hash(cfn_params['TemplateBody'] + parameters)
+
+
+def _hash(content):
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def _deploy(stack_name, region, template_body, params):
+    # boto3 clients are created per thread from their own session
+    cf = boto3.session.Session(region_name=region).client('cloudformation')
+    cfn_params = {
+        'StackName': stack_name,
+        'TemplateBody': template_body,
+        'Parameters': params,
+        'Capabilities': ['CAPABILITY_IAM']
+    }
+    return _update_or_create_stack(cf, cfn_params, stack_name)
 
 
 def _parse_parameters():
@@ -116,34 +193,39 @@ def _json_serial(obj):
 
 
 def main():
-    cf = boto3.client('cloudformation')
     args = get_args()
     if args.add_all:
-        template = _load_yaml_files(args.stack_name, RESOURCES)
+        resources = RESOURCES
     else:
         resources = _match_resources(args.resources)
-        if resources:
-            template = _load_yaml_files(args.stack_name, resources)
-        else:
+        if not resources:
             raise ValueError(f'Resources supported are: {RESOURCES}')
     params = _parse_parameters()
-    with open(template, 'r') as cfn_template:
-        cfn_params = {
-            'StackName': args.stack_name,
-            'TemplateBody': cfn_template.read(),
-            'Parameters': params,
-            'Capabilities': ['CAPABILITY_IAM']
+    templates = {stack_name: _load_yaml_files(stack_name, resources) for stack_name in args.stack_names}
+    deploys = [(stack_name, region) for stack_name in args.stack_names for region in args.regions or [None]]
+    with ThreadPoolExecutor(max_workers=args.max_parallel) as executor:
+        futures = {
+            executor.submit(_deploy, stack_name, region, templates[stack_name], params): (stack_name, region)
+            for stack_name, region in deploys
         }
-    _update_or_create_stack(cf, cfn_params, args.stack_name)
+    failures = []
+    for future, (stack_name, region) in futures.items():
+        error = future.exception()
+        if error:
+            failures.append(f'{region or "default region"}/{stack_name}: {error}')
+    if failures:
+        raise CfnError('Failed deploys:\n' + '\n'.join(failures))
 
 
 def get_args():
     parser = argparse.ArgumentParser(
         description='Create a Cloudformation stack importing specified AWS resources')
     parser.add_argument(
-        'stack_name',
+        'stack_names',
+        metavar='STACK_NAME',
+        nargs='+',
         type=str,
-        help='Enter the Cloudformation stack name'
+        help='Enter the Cloudformation stack name, or several names separated by spaces'
     )
     parser.add_argument(
         '--add-all',
@@ -155,6 +237,17 @@ def get_args():
         nargs='+',
         help=f'Resources you would like to import from AWS separated by spaces. Currently supports: {RESOURCES}'
     )
+    parser.add_argument(
+        '--regions',
+        nargs='+',
+        help='AWS regions to deploy the stacks to, defaults to the configured region'
+    )
+    parser.add_argument(
+        '--max-parallel',
+        type=int,
+        default=MAX_PARALLEL_DEPLOYS,
+        help='Maximum number of stacks deployed at the same time'
+    )
     args = parser.parse_args()
     if not (args.resources or args.add_all):
         parser.error('Must provide a resource to import or turn on --add-all flag')
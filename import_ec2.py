@@ -1,12 +1,8 @@
 #!/usr/bin/env/python
 
-import boto3
-import translators.ec2_translator
-import translators.placement_translator
-import itglue
-import itglue_adapter
-from multiprocessing import Process
 import argparse
+import importers.engine
+import itglue_adapter
 
 
 class EC2ImportError(Exception):
@@ -14,67 +10,15 @@ class EC2ImportError(Exception):
 
 
 def import_ec2_instances(organization, import_locations=True, instance_id=None):
-    ec2_type = itglue.ConfigurationType.first_or_create(name='EC2')
-    active_status, inactive_status = itglue_adapter.get_or_create_config_statuses()
-
-    # create a list to keep all processes
-    processes = []
-
-    instance_attributes = {
-        'organization': organization,
-        'conf_type': ec2_type
-    }
-
-    if instance_id:
-        instance = get_instances(instance_id)
-        instance_kwargs = configure_instance(instance, import_locations, organization.id, active_status, inactive_status, instance_attributes)
-        update_configuration_and_interfaces(instance, **instance_kwargs)
-    else:
-        instances = get_instances()
-        for instance in instances:
-            instance_kwargs = configure_instance(instance, import_locations, organization.id, active_status, inactive_status, instance_attributes)
-            process = Process(target=update_configuration_and_interfaces, args=(instance,), kwargs=instance_kwargs)
-            processes.append(process)
-        itglue_adapter.batch_start_processes(processes)
-
-
-def get_instances(instance_id=None):
-    ec2 = boto3.resource('ec2')
+    engine = importers.engine.ImportEngine(organization, import_locations=import_locations)
     if instance_id:
-        instance = ec2.Instance(instance_id)
-        return instance
-    return ec2.instances.all()
-
-
-def configure_instance(instance, import_locations, organization_id, active_status, inactive_status, instance_attributes):
-    instance_attributes['translated_instance'] = translate_instances(instance, active_status, inactive_status)
-    if import_locations:
-        location_attributes = translators.placement_translator.PlacementTranslator(instance.placement).translated
-        location_attributes['organization_id'] = organization_id
-        location = itglue.Location.first_or_create(parent=instance_attributes['organization'], **location_attributes)
-        instance_attributes['location'] = location
-    return instance_attributes
-
-
-def update_configuration_and_interfaces(instance, organization, translated_instance, conf_type, location=None):
-    configuration = itglue_adapter.update_or_create_configuration(
-        resource=translated_instance,
-        location=location,
-        organization=organization,
-        conf_type=conf_type
-    )
-    for interface in instance.network_interfaces:
-        primary = instance.private_ip_address == interface.private_ip_address
-        itglue_adapter.update_or_create_config_interface(interface, configuration, primary=primary)
-
-
-def translate_instances(instance, active_status, inactive_status):
-    translated_instance = translators.ec2_translator.EC2Translator(
-        instance,
-        active_status_id=active_status.id,
-        inactive_status_id=inactive_status.id
-    )
-    return translated_instance.translated
+        result = engine.import_ids('ec2', [instance_id])
+        errors = result.pop('errors')
+        if result['failed']:
+            error = errors.get(instance_id)
+            raise EC2ImportError('Failed to import instance {}: {}'.format(instance_id, error or 'instance not found')) from error
+        return result
+    return engine.run(['ec2'])
 
 
 # Command-line functions
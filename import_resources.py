@@ -0,0 +1,99 @@
+import argparse
+import json
+import itglue_adapter
+import importers.engine
+import importers.registry
+import inventory_snapshot
+
+
+def import_resources(organization, resource_names, import_locations=False, region_name=None, max_workers=importers.engine.MAX_WORKERS, snapshot_path=None, changed_only=False):
+    snapshot = inventory_snapshot.InventorySnapshot(snapshot_path) if snapshot_path else None
+    engine = importers.engine.ImportEngine(
+        organization,
+        import_locations=import_locations,
+        max_workers=max_workers,
+        snapshot=snapshot,
+        changed_only=changed_only
+    )
+    try:
+        return engine.run(resource_names, region_name=region_name)
+    finally:
+        if snapshot:
+            snapshot.close()
+
+
+# Command-line functions
+def main():
+    args = get_args()
+    organization = itglue_adapter.get_organization(args.organization)
+    resource_names = sorted(importers.registry.RESOURCE_TYPES) if args.add_all else args.resources
+    metrics = import_resources(
+        organization,
+        resource_names,
+        import_locations=args.import_locations,
+        region_name=args.region,
+        max_workers=args.max_workers,
+        snapshot_path=args.snapshot,
+        changed_only=args.changed_only
+    )
+    print(json.dumps(metrics, indent=2))
+    return True
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description='Import several AWS resource types as Configurations into an IT Glue Organization')
+    parser.add_argument(
+        'organization',
+        metavar='ORG_ID_OR_NAME',
+        type=str,
+        help='The ID or NAME of the parent organization'
+    )
+    parser.add_argument(
+        '-r', '--resources',
+        nargs='+',
+        choices=sorted(importers.registry.RESOURCE_TYPES),
+        help='Resources to import separated by spaces. Will be ignored if --add-all flag is true'
+    )
+    parser.add_argument(
+        '--add-all',
+        action='store_true',
+        help='Import every supported resource type'
+    )
+    parser.add_argument(
+        '-il', '--import-locations',
+        action='store_true',
+        help='Import EC2 placements as IT Glue Locations'
+    )
+    parser.add_argument(
+        '--region',
+        type=str,
+        help='AWS region to import from, defaults to the configured region'
+    )
+    parser.add_argument(
+        '--max-workers',
+        type=int,
+        default=importers.engine.MAX_WORKERS,
+        help='Maximum number of resources imported at the same time'
+    )
+    parser.add_argument(
+        '--snapshot',
+        metavar='SNAPSHOT_FILE',
+        type=str,
+        help='Record the AWS inventory and translated attributes in this snapshot file'
+    )
+    parser.add_argument(
+        '--changed-only',
+        action='store_true',
+        help='Only send resources that changed since they were last synced, requires --snapshot'
+    )
+    args = parser.parse_args()
+    if not (args.resources or args.add_all):
+        parser.error('Must provide a resource to import or turn on --add-all flag')
+    if args.changed_only and not args.snapshot:
+        parser.error('--changed-only requires --snapshot')
+    return args
+
+
+if __name__ == '__main__':
+    main()
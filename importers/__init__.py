@@ -0,0 +1,4 @@
+# Imported for their side effect of registering the built-in resource types
+from importers import ec2_importer, workspace_importer
+
+__all__ = ['ec2_importer', 'workspace_importer']
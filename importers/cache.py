@@ -0,0 +1,54 @@
+import threading
+import itglue
+import itglue_adapter
+import translators.placement_translator
+
+
+class LookupCache(object):
+    """Holds the IT Glue records that every import into one organization looks up
+
+    The configuration statuses are fetched by load(), and configuration types
+    and locations the first time they are needed. With lazy, nothing is fetched
+    until load() is called. configuration() never finds a match here, so the
+    adapter looks each configuration up itself.
+    """
+
+    def __init__(self, organization=None, lazy=False):
+        self.organization = organization
+        self.active_status = None
+        self.inactive_status = None
+        self.conf_types = {}
+        self.locations = {}
+        self._lock = threading.RLock()
+        if not lazy:
+            self.load()
+
+    def load(self):
+        """Fetches the configuration statuses and forgets the cached configuration types and locations"""
+        active_status, inactive_status = itglue_adapter.get_or_create_config_statuses()
+        with self._lock:
+            self.active_status, self.inactive_status = active_status, inactive_status
+            self.conf_types = {}
+            self.locations = {}
+
+    def conf_type(self, resource_type):
+        with self._lock:
+            if resource_type.name not in self.conf_types:
+                self.conf_types[resource_type.name] = itglue.ConfigurationType.first_or_create(name=resource_type.configuration_type)
+            return self.conf_types[resource_type.name]
+
+    def location(self, placement):
+        location_attributes = translators.placement_translator.PlacementTranslator(placement).translated
+        with self._lock:
+            name = location_attributes.get('name')
+            if name not in self.locations:
+                location_attributes['organization_id'] = self.organization.id
+                self.locations[name] = itglue.Location.first_or_create(parent=self.organization, **location_attributes)
+            return self.locations[name]
+
+    def configuration(self, resource):
+        """Returns the already known configuration for the translated resource, if any"""
+        return None
+
+    def index_configuration(self, configuration):
+        pass
@@ -0,0 +1,45 @@
+import boto3
+import importers.registry
+import translators.ec2_translator
+
+DESCRIBE_INSTANCES_MAX_FILTER_VALUES = 200
+
+
+def get_instances(region_name=None):
+    ec2 = boto3.resource('ec2', region_name=region_name)
+    return ec2.instances.all()
+
+
+def get_instances_by_ids(instance_ids, region_name=None):
+    """Returns the instances that still exist out of instance_ids
+
+    Filtering on instance-id, rather than passing InstanceIds, leaves out IDs
+    that no longer exist instead of failing with InvalidInstanceID.NotFound.
+    """
+    ec2 = boto3.resource('ec2', region_name=region_name)
+    instance_ids = list(instance_ids)
+    instances = []
+    for index in range(0, len(instance_ids), DESCRIBE_INSTANCES_MAX_FILTER_VALUES):
+        chunk = instance_ids[index:index + DESCRIBE_INSTANCES_MAX_FILTER_VALUES]
+        instances.extend(ec2.instances.filter(Filters=[{'Name': 'instance-id', 'Values': chunk}]))
+    return instances
+
+
+def _interfaces(instance, translated):
+    return [
+        {'interface': interface, 'primary': instance.private_ip_address == interface.private_ip_address}
+        for interface in instance.network_interfaces
+    ]
+
+
+EC2 = importers.registry.register(importers.registry.ResourceType(
+    name='ec2',
+    configuration_type='EC2',
+    collector=get_instances,
+    fetcher=get_instances_by_ids,
+    translator=translators.ec2_translator.EC2Translator,
+    resource_id=lambda instance: instance.id,
+    interfaces=_interfaces,
+    placement=lambda instance: instance.placement,
+    raw_data=lambda instance: instance.meta.data
+))
@@ -0,0 +1,222 @@
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import time
+import boto3
+import itglue_adapter
+import importers.cache
+import importers.registry
+import translators.placement_translator
+
+MAX_WORKERS = 20
+
+logger = logging.getLogger(__name__)
+
+
+class EngineError(Exception):
+    pass
+
+
+class ImportEngine(object):
+    """Syncs any registered resource types into one IT Glue Organization
+
+    Statuses, configuration types and locations are looked up once through a
+    LookupCache shared by every resource type. Resources are imported in batches
+    of itglue_adapter.PROCESS_BATCH_SIZE on a pool of threads.
+
+    With an InventorySnapshot every batch is recorded in it, and with
+    changed_only the resources whose attributes, location and interfaces match
+    what was last synced are not sent to IT Glue again.
+    """
+
+    def __init__(self, organization=None, import_locations=False, max_workers=MAX_WORKERS, batch_size=itglue_adapter.PROCESS_BATCH_SIZE, snapshot=None, changed_only=False, cache=None):
+        if changed_only and snapshot is None:
+            raise EngineError('changed_only requires a snapshot')
+        if cache is None:
+            if organization is None:
+                raise EngineError('Either an organization or a cache must be provided')
+            cache = importers.cache.LookupCache(organization)
+        self.cache = cache
+        self.import_locations = import_locations
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.snapshot = snapshot
+        self.changed_only = changed_only
+
+    def run(self, resource_names, region_name=None):
+        """Imports every resource of each named type, returning metrics per type"""
+        resource_types = [importers.registry.get_resource_type(name) for name in resource_names]
+        metrics = {}
+        if self.snapshot:
+            self.snapshot.start_run()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for resource_type in resource_types:
+                metrics[resource_type.name] = self._run_resource_type(executor, resource_type, region_name)
+                if self.snapshot:
+                    metrics[resource_type.name]['removed'] = self.snapshot.remove_missing(
+                        resource_type.name,
+                        _snapshot_region(region_name)
+                    )
+        if self.snapshot:
+            self.snapshot.finish_run()
+        return metrics
+
+    def import_ids(self, resource_name, resource_ids, region_name=None):
+        """Imports the resources with the given IDs and returns the imported and failed IDs
+
+        IDs that no longer exist in AWS are returned as failed, and errors maps the
+        other failed IDs to the exception they failed with. Nothing is recorded
+        in the snapshot, as a partial import cannot tell which resources were removed.
+        """
+        resource_type = importers.registry.get_resource_type(resource_name)
+        resources = list(resource_type.fetch(resource_ids, region_name=region_name))
+        result = self.import_resources(resource_name, resources)
+        found = set(resource_type.resource_id(resource) for resource in resources)
+        failed = result['failed'] + [resource_id for resource_id in resource_ids if resource_id not in found]
+        return {'imported': result['imported'], 'failed': failed, 'errors': result['errors']}
+
+    def import_resources(self, resource_name, resources, skip_unchanged=False):
+        """Imports already collected resources and returns the imported and failed IDs and the unchanged count
+
+        errors maps each failed ID to the exception it failed with.
+        With skip_unchanged, resources whose translated attributes match the
+        configuration the cache holds for them are not sent to IT Glue again.
+        Nothing is recorded in the snapshot.
+        """
+        resource_type = importers.registry.get_resource_type(resource_name)
+        metrics = self._new_metrics()
+        imported = []
+        errors = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for index in range(0, len(resources), self.batch_size):
+                batch = resources[index:index + self.batch_size]
+                imported.extend(self._import_batch(
+                    executor, resource_type, batch, metrics, record=False, skip_unchanged=skip_unchanged, errors=errors
+                ))
+        return {'imported': imported, 'failed': metrics['failed'], 'unchanged': metrics['unchanged'], 'errors': errors}
+
+    def import_resource(self, resource_type, resource, translated=None):
+        if translated is None:
+            translated = resource_type.translate(resource, self.cache.active_status, self.cache.inactive_status)
+        location = None
+        if self.import_locations and resource_type.placement:
+            location = self.cache.location(resource_type.placement(resource))
+        configuration = itglue_adapter.update_or_create_configuration(
+            resource=translated,
+            organization=self.cache.organization,
+            conf_type=self.cache.conf_type(resource_type),
+            location=location,
+            configuration=self.cache.configuration(translated)
+        )
+        self.cache.index_configuration(configuration)
+        for mapping in resource_type.interface_mappings(resource, translated):
+            itglue_adapter.update_or_create_config_interface(configuration=configuration, **mapping)
+        return configuration
+
+    def _synced_state(self, resource_type, resource, translated):
+        """Returns everything import_resource sends to IT Glue for a resource, for hashing"""
+        location = None
+        if self.import_locations and resource_type.placement:
+            location = translators.placement_translator.PlacementTranslator(resource_type.placement(resource)).translated
+        interfaces = []
+        for mapping in resource_type.interface_mappings(resource, translated):
+            primary_ip, attributes = itglue_adapter.config_interface_attributes(mapping['interface'], ip_address=mapping.get('ip_address'))
+            interfaces.append({'primary': mapping.get('primary'), 'primary_ip': primary_ip, 'attributes': attributes})
+        return {'attributes': translated, 'location': location, 'interfaces': interfaces}
+
+    def _matches_cache(self, resource_type, resource, translated):
+        """Whether the cached configuration for the resource already has its translated attributes and location
+
+        Configuration Interfaces are not compared.
+        """
+        configuration = self.cache.configuration(translated)
+        if configuration is None:
+            return False
+        attributes = dict(translated, configuration_type_id=self.cache.conf_type(resource_type).id)
+        if self.import_locations and resource_type.placement:
+            attributes['location_id'] = self.cache.location(resource_type.placement(resource)).id
+        return all(configuration.get_attribute(name) == value for name, value in attributes.items())
+
+    def _new_metrics(self):
+        return {'collected': 0, 'imported': 0, 'unchanged': 0, 'failed': []}
+
+    def _run_resource_type(self, executor, resource_type, region_name):
+        started_at = time.time()
+        metrics = self._new_metrics()
+        batch = []
+        for resource in resource_type.collect(region_name=region_name):
+            metrics['collected'] += 1
+            batch.append(resource)
+            if len(batch) >= self.batch_size:
+                self._import_batch(executor, resource_type, batch, metrics, region_name=region_name)
+                batch = []
+        if batch:
+            self._import_batch(executor, resource_type, batch, metrics, region_name=region_name)
+        metrics['seconds'] = round(time.time() - started_at, 2)
+        logger.info('Finished importing %s: %s', resource_type.name, metrics)
+        return metrics
+
+    def _import_batch(self, executor, resource_type, batch, metrics, region_name=None, record=True, skip_unchanged=False, errors=None):
+        """Imports one batch, updating metrics, and returns the IDs that were synced
+
+        The exception each failed resource raised is added to errors, when given.
+        """
+        if errors is None:
+            errors = {}
+        translated_batch = []
+        untranslated = []
+        for resource in batch:
+            resource_id = resource_type.resource_id(resource)
+            try:
+                translated = resource_type.translate(resource, self.cache.active_status, self.cache.inactive_status)
+                synced_state = self._synced_state(resource_type, resource, translated) if self.snapshot else None
+                unchanged = skip_unchanged and self._matches_cache(resource_type, resource, translated)
+            except Exception as error:
+                logger.exception('Failed to translate %s %s', resource_type.name, resource_id)
+                errors[resource_id] = error
+                metrics['failed'].append(resource_id)
+                untranslated.append(resource_id)
+            else:
+                if unchanged:
+                    metrics['unchanged'] += 1
+                    continue
+                translated_batch.append((resource_id, resource, translated, synced_state))
+        record = record and self.snapshot is not None
+        if record:
+            snapshot_region = _snapshot_region(region_name)
+            # Still collected, so these keep their last recorded state rather than being removed
+            self.snapshot.touch(resource_type.name, snapshot_region, untranslated)
+            hashes = self.snapshot.record(
+                resource_type.name,
+                snapshot_region,
+                [
+                    (resource_id, resource_type.raw(resource), translated, synced_state)
+                    for resource_id, resource, translated, synced_state in translated_batch
+                ]
+            )
+            if self.changed_only:
+                unsynced = set(self.snapshot.unsynced(resource_type.name, snapshot_region, hashes))
+                metrics['unchanged'] += len(translated_batch) - len(unsynced)
+                translated_batch = [row for row in translated_batch if row[0] in unsynced]
+        futures = [
+            # The adapter adds location_id to the attributes it is given, so it gets a copy
+            (resource_id, executor.submit(self.import_resource, resource_type, resource, dict(translated)))
+            for resource_id, resource, translated, _ in translated_batch
+        ]
+        synced = []
+        for resource_id, future in futures:
+            error = future.exception()
+            if error:
+                logger.error('Failed to import %s %s', resource_type.name, resource_id, exc_info=error)
+                errors[resource_id] = error
+                metrics['failed'].append(resource_id)
+            else:
+                metrics['imported'] += 1
+                synced.append(resource_id)
+        if record:
+            self.snapshot.mark_synced(resource_type.name, snapshot_region, synced)
+        return synced
+
+
+def _snapshot_region(region_name):
+    # Snapshot rows are kept per region, so the default region is stored by name
+    return region_name or boto3.session.Session().region_name or ''
@@ -0,0 +1,74 @@
+class RegistryError(Exception):
+    pass
+
+
+class ResourceType(object):
+    """Describes how one kind of AWS resource is synced into IT Glue Configurations
+
+    name - the key used on the command line (e.g. ec2)
+    configuration_type - the name of the IT Glue Configuration Type
+    collector - callable taking region_name that returns every resource, paginating as needed
+    fetcher - callable taking a list of IDs and region_name that returns the resources
+        that still exist out of those IDs
+    translator - the BaseTranslator subclass that turns a resource into Configuration attributes
+    resource_id - callable returning the AWS ID of a resource
+    interfaces - optional callable taking the resource and its translated attributes,
+        returning the keyword arguments for each itglue_adapter.update_or_create_config_interface call
+    placement - optional callable returning the placement used to import a Location
+    raw_data - optional callable returning the resource as JSON-serializable AWS data,
+        defaults to the resource itself
+    """
+
+    def __init__(self, name, configuration_type, collector, fetcher, translator, resource_id, interfaces=None, placement=None, raw_data=None):
+        self.name = name
+        self.configuration_type = configuration_type
+        self.collector = collector
+        self.fetcher = fetcher
+        self.translator = translator
+        self.resource_id = resource_id
+        self.interfaces = interfaces
+        self.placement = placement
+        self.raw_data = raw_data
+
+    def collect(self, region_name=None):
+        return self.collector(region_name=region_name)
+
+    def collect_ids(self, region_name=None):
+        return [self.resource_id(resource) for resource in self.collect(region_name=region_name)]
+
+    def fetch(self, resource_ids, region_name=None):
+        return self.fetcher(resource_ids, region_name=region_name)
+
+    def translate(self, resource, active_status, inactive_status):
+        return self.translator(
+            resource,
+            active_status_id=active_status.id,
+            inactive_status_id=inactive_status.id
+        ).translated
+
+    def raw(self, resource):
+        if self.raw_data:
+            return self.raw_data(resource)
+        return resource
+
+    def interface_mappings(self, resource, translated):
+        if not self.interfaces:
+            return []
+        return self.interfaces(resource, translated)
+
+
+RESOURCE_TYPES = {}
+
+
+def register(resource_type):
+    if resource_type.name in RESOURCE_TYPES:
+        raise RegistryError('Resource type {} is already registered'.format(resource_type.name))
+    RESOURCE_TYPES[resource_type.name] = resource_type
+    return resource_type
+
+
+def get_resource_type(name):
+    try:
+        return RESOURCE_TYPES[name]
+    except KeyError:
+        raise RegistryError('Resources supported are: {}'.format(sorted(RESOURCE_TYPES)))
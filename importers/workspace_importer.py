@@ -0,0 +1,49 @@
+import boto3
+import importers.registry
+import translators.workspace_translator
+
+DESCRIBE_WORKSPACES_MAX_IDS = 25
+
+
+def get_workspaces(region_name=None):
+    workspace_client = boto3.client('workspaces', region_name=region_name)
+    workspaces = []
+    paginator = workspace_client.get_paginator('describe_workspaces')
+    response_iterator = paginator.paginate(
+        PaginationConfig={
+            'PageSize': 10,
+            'StartingToken': None
+        }
+    )
+    for page in response_iterator:
+        workspaces.extend(page['Workspaces'])
+    return workspaces
+
+
+def get_workspaces_by_ids(workspace_ids, region_name=None):
+    workspace_client = boto3.client('workspaces', region_name=region_name)
+    workspace_ids = list(workspace_ids)
+    workspaces = []
+    # DescribeWorkspaces accepts at most 25 IDs per call
+    for index in range(0, len(workspace_ids), DESCRIBE_WORKSPACES_MAX_IDS):
+        chunk = workspace_ids[index:index + DESCRIBE_WORKSPACES_MAX_IDS]
+        response = workspace_client.describe_workspaces(WorkspaceIds=chunk)
+        workspaces.extend(response.get('Workspaces'))
+    return workspaces
+
+
+def _interfaces(workspace, translated):
+    if not translated.get('ip_address'):
+        return []
+    return [{'interface': translated, 'primary': True, 'ip_address': translated.get('ip_address')}]
+
+
+WORKSPACE = importers.registry.register(importers.registry.ResourceType(
+    name='workspace',
+    configuration_type='Workspace',
+    collector=get_workspaces,
+    fetcher=get_workspaces_by_ids,
+    translator=translators.workspace_translator.WorkspaceTranslator,
+    resource_id=lambda workspace: workspace.get('WorkspaceId'),
+    interfaces=_interfaces
+))
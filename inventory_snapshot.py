@@ -0,0 +1,302 @@
+import argparse
+import datetime
+import hashlib
+import json
+import sqlite3
+import zlib
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS runs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        started_at TEXT NOT NULL,
+        finished_at TEXT
+    )""",
+    # Latest state of every resource seen, raw holds the zlib compressed AWS data
+    """CREATE TABLE IF NOT EXISTS resources (
+        resource_type TEXT NOT NULL,
+        region TEXT NOT NULL,
+        resource_id TEXT NOT NULL,
+        content_hash TEXT NOT NULL,
+        state_hash TEXT NOT NULL,
+        synced_hash TEXT,
+        attributes TEXT NOT NULL,
+        raw BLOB,
+        first_seen_run INTEGER NOT NULL,
+        last_seen_run INTEGER NOT NULL,
+        PRIMARY KEY (resource_type, region, resource_id)
+    )""",
+    # One row per run in which a resource was added, changed or removed
+    """CREATE TABLE IF NOT EXISTS changes (
+        run_id INTEGER NOT NULL,
+        resource_type TEXT NOT NULL,
+        region TEXT NOT NULL,
+        resource_id TEXT NOT NULL,
+        change TEXT NOT NULL,
+        content_hash TEXT,
+        attributes TEXT
+    )""",
+    'CREATE INDEX IF NOT EXISTS changes_resource ON changes (resource_type, resource_id)',
+    'CREATE INDEX IF NOT EXISTS changes_run ON changes (run_id)'
+]
+
+# Bumped whenever SCHEMA changes in a way older snapshot files cannot be used with
+SCHEMA_VERSION = 1
+
+ADDED = 'added'
+CHANGED = 'changed'
+REMOVED = 'removed'
+
+# Stays well below SQLite's limit on the number of parameters in one statement
+QUERY_BATCH_SIZE = 500
+
+
+class SnapshotError(Exception):
+    pass
+
+
+class InventorySnapshot(object):
+    """Keeps the discovered AWS inventory and its translated IT Glue attributes in a SQLite file
+
+    Each row is keyed by resource type, region and ID and carries a content hash
+    of its translated attributes, so a run only writes history for rows whose hash
+    changed. A second hash covers everything synced to IT Glue for the row and
+    is what unsynced() compares. Rows are recorded a batch at a time to keep
+    memory flat for large inventories.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        version = self.connection.execute('PRAGMA user_version').fetchone()[0]
+        has_tables = self.connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'resources'").fetchone()
+        if has_tables and version != SCHEMA_VERSION:
+            raise SnapshotError(f'{path} was written by a different version, start a new snapshot file')
+        for statement in SCHEMA:
+            self.connection.execute(statement)
+        self.connection.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        self.connection.commit()
+        self.run_id = None
+
+    def start_run(self):
+        cursor = self.connection.execute('INSERT INTO runs (started_at) VALUES (?)', (_now(),))
+        self.connection.commit()
+        self.run_id = cursor.lastrowid
+        return self.run_id
+
+    def finish_run(self):
+        self._require_run()
+        self.connection.execute('UPDATE runs SET finished_at = ? WHERE id = ?', (_now(), self.run_id))
+        self.connection.commit()
+        self.run_id = None
+
+    def record(self, resource_type, region, rows):
+        """Stores (resource_id, raw, attributes, synced_state) rows and returns the state hash of each resource ID
+
+        The content hash is taken over attributes and decides which rows are
+        recorded as changed. The state hash is taken over synced_state, everything
+        that is sent to IT Glue for the resource, and is what unsynced() compares.
+        """
+        self._require_run()
+        rows = [
+            (resource_id, raw, attributes, content_hash(attributes), content_hash(synced_state))
+            for resource_id, raw, attributes, synced_state in rows
+        ]
+        previous = self._hashes(resource_type, region, [row[0] for row in rows])
+        changes = []
+        inserts = []
+        updates = []
+        for resource_id, raw, attributes, row_hash, state_hash in rows:
+            attributes_json = _dumps(attributes)
+            if resource_id not in previous:
+                changes.append((self.run_id, resource_type, region, resource_id, ADDED, row_hash, attributes_json))
+                inserts.append((resource_type, region, resource_id, row_hash, state_hash, attributes_json, _compress(raw), self.run_id, self.run_id))
+            else:
+                if previous[resource_id] != row_hash:
+                    changes.append((self.run_id, resource_type, region, resource_id, CHANGED, row_hash, attributes_json))
+                updates.append((row_hash, state_hash, attributes_json, _compress(raw), self.run_id, resource_type, region, resource_id))
+        self.connection.executemany(
+            """INSERT INTO resources
+                   (resource_type, region, resource_id, content_hash, state_hash, attributes, raw, first_seen_run, last_seen_run)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            inserts
+        )
+        self.connection.executemany(
+            """UPDATE resources SET content_hash = ?, state_hash = ?, attributes = ?, raw = ?, last_seen_run = ?
+               WHERE resource_type = ? AND region = ? AND resource_id = ?""",
+            updates
+        )
+        self.connection.executemany('INSERT INTO changes VALUES (?, ?, ?, ?, ?, ?, ?)', changes)
+        self.connection.commit()
+        return {resource_id: state_hash for resource_id, _, _, _, state_hash in rows}
+
+    def touch(self, resource_type, region, resource_ids):
+        """Marks resources as seen in this run without changing their recorded state
+
+        Used for resources that were collected but could not be translated, so
+        they are not treated as removed.
+        """
+        self._require_run()
+        self.connection.executemany(
+            'UPDATE resources SET last_seen_run = ? WHERE resource_type = ? AND region = ? AND resource_id = ?',
+            [(self.run_id, resource_type, region, resource_id) for resource_id in resource_ids]
+        )
+        self.connection.commit()
+
+    def unsynced(self, resource_type, region, hashes):
+        """Returns the resource IDs whose state hash differs from the one last synced to IT Glue"""
+        synced = self._hashes(resource_type, region, list(hashes), column='synced_hash')
+        return [resource_id for resource_id, row_hash in hashes.items() if synced.get(resource_id) != row_hash]
+
+    def mark_synced(self, resource_type, region, resource_ids):
+        self.connection.executemany(
+            'UPDATE resources SET synced_hash = state_hash WHERE resource_type = ? AND region = ? AND resource_id = ?',
+            [(resource_type, region, resource_id) for resource_id in resource_ids]
+        )
+        self.connection.commit()
+
+    def remove_missing(self, resource_type, region):
+        """Records every resource of the type in the region not seen during this run as removed"""
+        self._require_run()
+        self.connection.execute(
+            """INSERT INTO changes (run_id, resource_type, region, resource_id, change)
+               SELECT ?, resource_type, region, resource_id, ? FROM resources
+               WHERE resource_type = ? AND region = ? AND last_seen_run != ?""",
+            (self.run_id, REMOVED, resource_type, region, self.run_id)
+        )
+        cursor = self.connection.execute(
+            'DELETE FROM resources WHERE resource_type = ? AND region = ? AND last_seen_run != ?',
+            (resource_type, region, self.run_id)
+        )
+        self.connection.commit()
+        return cursor.rowcount
+
+    def changes(self, run_id=None):
+        """Returns the changes recorded in a run, defaulting to the latest finished run"""
+        if run_id is None:
+            run_id = self.connection.execute('SELECT MAX(id) FROM runs WHERE finished_at IS NOT NULL').fetchone()[0]
+        return [dict(row) for row in self.connection.execute(
+            'SELECT resource_type, region, resource_id, change, content_hash FROM changes WHERE run_id = ? ORDER BY resource_type, region, resource_id',
+            (run_id,)
+        )]
+
+    def history(self, resource_type, resource_id):
+        """Returns every recorded change of a resource, oldest first, with its run time and attributes"""
+        return [
+            {
+                'run_id': row['run_id'],
+                'started_at': row['started_at'],
+                'region': row['region'],
+                'change': row['change'],
+                'attributes': json.loads(row['attributes']) if row['attributes'] else None
+            }
+            for row in self.connection.execute(
+                """SELECT changes.run_id, runs.started_at, changes.region, changes.change, changes.attributes
+                   FROM changes JOIN runs ON runs.id = changes.run_id
+                   WHERE changes.resource_type = ? AND changes.resource_id = ?
+                   ORDER BY changes.run_id""",
+                (resource_type, resource_id)
+            )
+        ]
+
+    def attribute_history(self, resource_type, resource_id, attribute):
+        """Returns (started_at, value) for each run in which the attribute took a new value"""
+        values = []
+        for change in self.history(resource_type, resource_id):
+            value = change['attributes'].get(attribute) if change['attributes'] else None
+            if not values or values[-1][1] != value:
+                values.append((change['started_at'], value))
+        return values
+
+    def raw(self, resource_type, region, resource_id):
+        row = self.connection.execute(
+            'SELECT raw FROM resources WHERE resource_type = ? AND region = ? AND resource_id = ?',
+            (resource_type, region, resource_id)
+        ).fetchone()
+        if row and row['raw']:
+            return json.loads(zlib.decompress(row['raw']).decode('utf-8'))
+
+    def close(self):
+        self.connection.close()
+
+    def _hashes(self, resource_type, region, resource_ids, column='content_hash'):
+        hashes = {}
+        for index in range(0, len(resource_ids), QUERY_BATCH_SIZE):
+            chunk = resource_ids[index:index + QUERY_BATCH_SIZE]
+            placeholders = ', '.join('?' * len(chunk))
+            query = f'SELECT resource_id, {column} FROM resources WHERE resource_type = ? AND region = ? AND resource_id IN ({placeholders})'
+            for resource_id, row_hash in self.connection.execute(query, [resource_type, region] + chunk):
+                hashes[resource_id] = row_hash
+        return hashes
+
+    def _require_run(self):
+        if self.run_id is None:
+            raise SnapshotError('start_run must be called before recording a snapshot')
+
+
+def content_hash(attributes):
+    return hashlib.sha1(_dumps(attributes).encode('utf-8')).hexdigest()
+
+
+def _dumps(data):
+    # default=str covers the datetimes in boto3 responses
+    return json.dumps(data, sort_keys=True, default=str)
+
+
+def _compress(raw):
+    if raw is None:
+        return None
+    return zlib.compress(_dumps(raw).encode('utf-8'))
+
+
+def _now():
+    return datetime.datetime.utcnow().isoformat()
+
+
+# Command-line functions
+def main():
+    args = get_args()
+    snapshot = InventorySnapshot(args.snapshot)
+    if args.history:
+        resource_type, resource_id = args.history
+        if args.attribute:
+            result = snapshot.attribute_history(resource_type, resource_id, args.attribute)
+        else:
+            result = snapshot.history(resource_type, resource_id)
+    else:
+        result = snapshot.changes(args.run)
+    snapshot.close()
+    print(json.dumps(result, indent=2))
+    return True
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description='Query the inventory snapshot written by import_resources.py --snapshot')
+    parser.add_argument(
+        'snapshot',
+        metavar='SNAPSHOT_FILE',
+        type=str,
+        help='Path to the snapshot file'
+    )
+    parser.add_argument(
+        '--run',
+        type=int,
+        help='ID of the run to list changes for, defaults to the latest finished run'
+    )
+    parser.add_argument(
+        '--history',
+        nargs=2,
+        metavar=('RESOURCE', 'RESOURCE_ID'),
+        help='List every recorded change of one resource instead'
+    )
+    parser.add_argument(
+        '--attribute',
+        type=str,
+        help='With --history, only list when this attribute changed value'
+    )
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main()
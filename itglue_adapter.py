@@ -20,13 +20,14 @@ def get_organization(org_id_or_name):
         return orgs[0]
 
 
-def update_or_create_configuration(resource, organization, conf_type, location=None):
-    filters = {'organization_id': organization.id,
-               'name': resource.get('name')
-               }
-    if resource.get('serial_number'):
-        filters['serial_number'] = resource.get('serial_number')
-    configuration = itglue.Configuration.find_by(**filters) or itglue.Configuration(organization_id=organization.id)
+def update_or_create_configuration(resource, organization, conf_type, location=None, configuration=None):
+    if configuration is None:
+        filters = {'organization_id': organization.id,
+                   'name': resource.get('name')
+                   }
+        if resource.get('serial_number'):
+            filters['serial_number'] = resource.get('serial_number')
+        configuration = itglue.Configuration.find_by(**filters) or itglue.Configuration(organization_id=organization.id)
     if location:
         resource['location_id'] = location.id
     configuration.set_attributes(configuration_type_id=conf_type.id, **resource)
@@ -35,13 +36,7 @@ def update_or_create_configuration(resource, organization, conf_type, location=N
 
 
 def update_or_create_config_interface(interface, configuration, primary=False, ip_address=None):
-    if ip_address:
-        primary_ip = interface.get('ip_address')
-        interface_attributes = {'ip_address': primary_ip,
-                                'notes': interface.get('ip_notes')}
-    else:
-        interface_attributes = translators.network_interface_translator.NetworkInterfaceTranslator(interface).translated
-        primary_ip = interface.private_ip_address
+    primary_ip, interface_attributes = config_interface_attributes(interface, ip_address=ip_address)
     config_interface = itglue.ConfigurationInterface.first_or_initialize(
         parent=configuration,
         configuration_id=configuration.id,
@@ -51,6 +46,18 @@ def update_or_create_config_interface(interface, configuration, primary=False, i
     config_interface.save()
 
 
+def config_interface_attributes(interface, ip_address=None):
+    """Returns the primary IP and the attributes a Configuration Interface is saved with"""
+    if ip_address:
+        primary_ip = interface.get('ip_address')
+        interface_attributes = {'ip_address': primary_ip,
+                                'notes': interface.get('ip_notes')}
+    else:
+        interface_attributes = translators.network_interface_translator.NetworkInterfaceTranslator(interface).translated
+        primary_ip = interface.private_ip_address
+    return primary_ip, interface_attributes
+
+
 def get_or_create_config_statuses():
     active_status = itglue.ConfigurationStatus.first_or_create(name='Active')
     inactive_status = itglue.ConfigurationStatus.first_or_create(name='Inactive')
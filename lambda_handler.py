@@ -2,6 +2,7 @@ import os
 from import_ec2 import import_ec2_instances
 from import_workspace import import_workspaces
 from itglue_adapter import get_organization
+import sync_coordinator
 import logging
 
 logger = logging.getLogger(__name__)
@@ -31,6 +32,45 @@ def workspace_handler(event, context):
     return import_workspaces(organization)
 
 
-def get_org():
-    org_name_or_id = os.environ.get('ORGANIZATION')
+def shard_handler(event, context):
+    """Imports one shard of resource IDs handed out by sync_coordinator_handler"""
+    organization = get_org(event.get('organization'))
+    logger.info(
+        'Invoked Function ARN: %s Name of the executing Lambda function: %s Resource: %s Shard: %s Size: %s',
+        context.invoked_function_arn,
+        context.log_group_name,
+        event['resource'],
+        event.get('shard'),
+        len(event['ids'])
+    )
+    return sync_coordinator.run_shard(event, organization)
+
+
+def sync_coordinator_handler(event, context):
+    """Shards a full import and invokes SHARD_FUNCTION_NAME once per shard"""
+    logger.info(
+        'Invoked Function ARN: %s Name of the executing Lambda function: %s Resource: %s',
+        context.invoked_function_arn,
+        context.log_group_name,
+        event['resource']
+    )
+    dispatcher = sync_coordinator.LambdaDispatcher(
+        os.environ['SHARD_FUNCTION_NAME'],
+        max_workers=event.get('max_parallel', sync_coordinator.MAX_PARALLEL_INVOCATIONS)
+    )
+    shard_options = {}
+    if 'import_locations' in event:
+        shard_options['import_locations'] = event['import_locations']
+    return sync_coordinator.run_full_sync(
+        event['resource'],
+        dispatcher,
+        regions=event.get('regions'),
+        strategy=event.get('strategy', 'hash'),
+        shard_size=event.get('shard_size', sync_coordinator.SHARD_SIZE),
+        **shard_options
+    )
+
+
+def get_org(org_name_or_id=None):
+    org_name_or_id = org_name_or_id or os.environ.get('ORGANIZATION')
     return get_organization(org_name_or_id)
@@ -20,8 +20,9 @@ def create_zip(zip_file_name):
                 print('Compressing package:', package)
                 package_path = os.path.join(folder_path, package)
                 zip_dir(package_path, folder_path, zip_file)
-    print('Compressing translators')
-    zip_file = zip_dir('translators', current_path, zip_file)
+    for package in ['translators', 'importers']:
+        print('Compressing', package)
+        zip_file = zip_dir(package, current_path, zip_file)
     return zip_file
 
 
@@ -0,0 +1,254 @@
+import argparse
+import hashlib
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+import boto3
+import botocore.config
+import botocore.exceptions
+import importers.engine
+import importers.registry
+import itglue_adapter
+
+SHARD_SIZE = 50
+MAX_PARALLEL_INVOCATIONS = 20
+# Matches the worker's Timeout in templates/coordinator.yaml
+WORKER_TIMEOUT = 900
+# A throttled invoke never ran the shard, so it is safe to retry
+THROTTLE_ERROR_CODES = ['TooManyRequestsException']
+THROTTLE_RETRIES = 5
+PARTITION_STRATEGIES = ['hash', 'page']
+
+logger = logging.getLogger(__name__)
+
+
+class CoordinatorError(Exception):
+    pass
+
+
+class LocalDispatcher(object):
+    """Runs every shard through run_shard in this process"""
+
+    def __init__(self, organization):
+        self.organization = organization
+
+    def dispatch(self, events):
+        return [self._invoke(event) for event in events]
+
+    def _invoke(self, event):
+        try:
+            return run_shard(event, self.organization)
+        except Exception as error:
+            logger.exception('Shard %s failed', event.get('shard'))
+            # Count the whole shard as failed, as LambdaDispatcher does when a shard cannot run
+            return shard_result(event, imported=[], failed=event['ids'], error=str(error))
+
+
+class LambdaDispatcher(object):
+    """Invokes a deployed worker function once per shard, in parallel"""
+
+    def __init__(self, function_name, max_workers=MAX_PARALLEL_INVOCATIONS, region_name=None):
+        self.function_name = function_name
+        self.max_workers = max_workers
+        # The default 60 second read timeout would cut off long shards, and a retry would import them twice,
+        # so botocore does not retry and only throttled invokes are retried in _invoke_function
+        config = botocore.config.Config(read_timeout=WORKER_TIMEOUT + 10, retries={'max_attempts': 0})
+        self.client = boto3.client('lambda', region_name=region_name, config=config)
+
+    def dispatch(self, events):
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(self._invoke, events))
+
+    def _invoke(self, event):
+        try:
+            response = self._invoke_function(event)
+            payload = json.loads(response['Payload'].read())
+        except (botocore.exceptions.ClientError, botocore.exceptions.BotoCoreError) as error:
+            logger.exception('Shard %s could not be invoked', event.get('shard'))
+            return shard_result(event, imported=[], failed=event['ids'], error=str(error))
+        if response.get('FunctionError'):
+            # Count the whole shard as failed so it can be retried on its own
+            return shard_result(event, imported=[], failed=event['ids'], error=payload)
+        return payload
+
+    def _invoke_function(self, event):
+        for attempt in range(THROTTLE_RETRIES + 1):
+            try:
+                return self.client.invoke(
+                    FunctionName=self.function_name,
+                    InvocationType='RequestResponse',
+                    Payload=json.dumps(event).encode('utf-8')
+                )
+            except botocore.exceptions.ClientError as error:
+                if error.response['Error']['Code'] not in THROTTLE_ERROR_CODES or attempt == THROTTLE_RETRIES:
+                    raise
+                logger.info('Shard %s was throttled, retrying', event.get('shard'))
+                time.sleep(2 ** attempt)
+
+
+def run_full_sync(resource, dispatcher, regions=None, strategy='hash', shard_size=SHARD_SIZE, **shard_options):
+    """Discovers a resource type's inventory, shards it and aggregates the results of every shard
+
+    Extra keyword arguments (e.g. organization, import_locations) are passed through
+    in each shard event for the worker handler.
+    """
+    events = build_shard_events(resource, regions=regions, strategy=strategy, shard_size=shard_size, **shard_options)
+    results = dispatcher.dispatch(events)
+    return aggregate_results(resource, results)
+
+
+def run_shard(event, organization):
+    """Imports the resource IDs of one shard event into the organization"""
+    engine = importers.engine.ImportEngine(organization, import_locations=event.get('import_locations', True))
+    result = engine.import_ids(event['resource'], event['ids'], region_name=event.get('region'))
+    return shard_result(event, imported=result['imported'], failed=result['failed'])
+
+
+def build_shard_events(resource, regions=None, strategy='hash', shard_size=SHARD_SIZE, **shard_options):
+    resource_type = importers.registry.get_resource_type(resource)
+    events = []
+    for region in regions or [None]:
+        resource_ids = resource_type.collect_ids(region_name=region)
+        for shard in partition(resource_ids, strategy=strategy, shard_size=shard_size):
+            event = {
+                'resource': resource,
+                'region': region,
+                'shard': len(events),
+                'ids': shard
+            }
+            event.update(shard_options)
+            events.append(event)
+    return events
+
+
+def partition(resource_ids, strategy='hash', shard_size=SHARD_SIZE):
+    """Splits resource IDs into shards of about shard_size IDs
+
+    'page' keeps discovery order and cuts it into consecutive pages.
+    'hash' buckets each ID by a stable hash, so an ID lands on the same shard
+    across runs as long as the inventory size stays in the same range.
+    """
+    if shard_size < 1:
+        raise CoordinatorError('shard_size must be at least 1')
+    resource_ids = list(resource_ids)
+    if strategy == 'page':
+        return [resource_ids[index:index + shard_size] for index in range(0, len(resource_ids), shard_size)]
+    if strategy == 'hash':
+        shard_count = -(-len(resource_ids) // shard_size)
+        shards = [[] for _ in range(shard_count)]
+        for resource_id in resource_ids:
+            shards[_stable_hash(resource_id) % shard_count].append(resource_id)
+        return [shard for shard in shards if shard]
+    raise CoordinatorError(f'Partition strategies supported are: {PARTITION_STRATEGIES}')
+
+
+def aggregate_results(resource, results):
+    imported = []
+    failed = []
+    errors = []
+    for result in results:
+        imported.extend(result.get('imported', []))
+        failed.extend(result.get('failed', []))
+        if result.get('error'):
+            errors.append({'shard': result.get('shard'), 'error': result['error']})
+    return {
+        'resource': resource,
+        'shards': len(results),
+        'imported_count': len(imported),
+        'failed_count': len(failed),
+        'failed': failed,
+        'errors': errors
+    }
+
+
+def shard_result(event, imported, failed, error=None):
+    result = {
+        'resource': event['resource'],
+        'region': event.get('region'),
+        'shard': event.get('shard'),
+        'imported': imported,
+        'failed': failed
+    }
+    if error:
+        result['error'] = error
+    return result
+
+
+def _stable_hash(resource_id):
+    # hash() is salted per process, which would reshuffle shards on every run
+    return int(hashlib.md5(resource_id.encode('utf-8')).hexdigest(), 16)
+
+
+# Command-line functions
+def main():
+    args = get_args()
+    if args.function_name:
+        dispatcher = LambdaDispatcher(args.function_name, max_workers=args.max_parallel)
+    else:
+        dispatcher = LocalDispatcher(itglue_adapter.get_organization(args.organization))
+    shard_options = {'organization': args.organization, 'import_locations': args.import_locations}
+    summary = run_full_sync(
+        args.resource,
+        dispatcher,
+        regions=args.regions,
+        strategy=args.strategy,
+        shard_size=args.shard_size,
+        **shard_options
+    )
+    print(json.dumps(summary, indent=2))
+    return True
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description='Run a full import split into shards, either in-process or across Lambda invocations')
+    parser.add_argument(
+        'organization',
+        metavar='ORG_ID_OR_NAME',
+        type=str,
+        help='The ID or NAME of the parent organization'
+    )
+    parser.add_argument(
+        'resource',
+        choices=sorted(importers.registry.RESOURCE_TYPES),
+        help='The resource type to sync'
+    )
+    parser.add_argument(
+        '--regions',
+        nargs='+',
+        help='AWS regions to discover resources in, defaults to the configured region'
+    )
+    parser.add_argument(
+        '--strategy',
+        choices=PARTITION_STRATEGIES,
+        default='hash',
+        help='How resource IDs are split into shards'
+    )
+    parser.add_argument(
+        '--shard-size',
+        type=int,
+        default=SHARD_SIZE,
+        help='Target number of resources per shard'
+    )
+    parser.add_argument(
+        '--function-name',
+        type=str,
+        help='Name of the worker Lambda function to invoke per shard, runs shards locally if omitted'
+    )
+    parser.add_argument(
+        '--max-parallel',
+        type=int,
+        default=MAX_PARALLEL_INVOCATIONS,
+        help='Maximum number of concurrent Lambda invocations'
+    )
+    parser.add_argument(
+        '-il', '--import-locations',
+        action='store_true',
+        help='Import EC2 placements as IT Glue Locations'
+    )
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,416 @@
+import argparse
+import heapq
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import itertools
+import json
+import logging
+from socketserver import ThreadingMixIn
+import threading
+import time
+import itglue
+import itglue_adapter
+import importers.cache
+import importers.engine
+import importers.registry
+
+EVENT_PRIORITY = 0
+RECONCILE_PRIORITY = 1
+RECONCILE_INTERVAL = 3600
+CACHE_TTL = 3600
+DEFAULT_PORT = 8080
+MAX_BACKOFF = 300
+MAX_RETRIES = 5
+
+logger = logging.getLogger(__name__)
+
+
+class SyncDaemonError(Exception):
+    pass
+
+
+class WorkQueue(object):
+    """Priority queue of (resource, resource_id) updates that coalesces duplicates
+
+    A resource that is already pending is not queued twice. If the new request
+    has a higher priority (lower number) the pending entry is promoted instead.
+    Each entry can carry the resource already collected from AWS, so it does not
+    have to be fetched again.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._pending = {}
+        self._data = {}
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self.coalesced = 0
+
+    def put(self, resource, resource_id, priority, data=None):
+        key = (resource, resource_id)
+        with self._condition:
+            pending_priority = self._pending.get(key)
+            if pending_priority is not None:
+                self.coalesced += 1
+                if pending_priority == priority:
+                    # Keeps the most recently collected data for the pending entry
+                    self._data[key] = data
+                if pending_priority <= priority:
+                    return False
+            # Any older heap entry for this key is skipped in get_batch() once the priority no longer matches
+            self._pending[key] = priority
+            self._data[key] = data
+            heapq.heappush(self._heap, (priority, next(self._counter), key))
+            self._condition.notify()
+            return True
+
+    def get_batch(self, timeout=None, limit=1):
+        """Returns up to limit (resource, resource_id, priority, data) entries of one resource and priority"""
+        with self._condition:
+            deadline = None if timeout is None else time.time() + timeout
+            while not self._heap:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return []
+                self._condition.wait(remaining)
+            batch = []
+            while self._heap and len(batch) < limit:
+                priority, _, key = self._heap[0]
+                if self._pending.get(key) != priority:
+                    heapq.heappop(self._heap)
+                    continue
+                if batch and (priority != batch[0][2] or key[0] != batch[0][0]):
+                    break
+                heapq.heappop(self._heap)
+                del self._pending[key]
+                batch.append(key + (priority, self._data.pop(key)))
+            return batch
+
+    def depth(self):
+        with self._condition:
+            counts = {EVENT_PRIORITY: 0, RECONCILE_PRIORITY: 0}
+            for priority in self._pending.values():
+                counts[priority] = counts.get(priority, 0) + 1
+            return {'events': counts[EVENT_PRIORITY], 'reconcile': counts[RECONCILE_PRIORITY]}
+
+
+class SyncCache(importers.cache.LookupCache):
+    """Keeps the IT Glue lookups that every import repeats warm between updates
+
+    Adds to LookupCache an index of the organization's configurations by
+    (name, serial_number). Nothing is loaded until refresh() is called, and
+    everything is reloaded once it is older than ttl seconds.
+    """
+
+    def __init__(self, org_id_or_name, ttl=CACHE_TTL):
+        super().__init__(lazy=True)
+        self.org_id_or_name = org_id_or_name
+        self.ttl = ttl
+        self.loaded_at = None
+        self.configurations = {}
+
+    def refresh(self, force=False):
+        with self._lock:
+            if not force and self.loaded_at and time.time() - self.loaded_at < self.ttl:
+                return False
+            # Everything is fetched before any of it is replaced, so a failed reload keeps the old caches
+            organization = itglue_adapter.get_organization(self.org_id_or_name)
+            configurations = list(itglue.Configuration.filter(organization_id=organization.id))
+            self.load()
+            self.organization = organization
+            self.configurations = {}
+            for configuration in configurations:
+                self.index_configuration(configuration)
+            self.loaded_at = time.time()
+            logger.info('Cache loaded with %s configurations', len(self.configurations))
+            return True
+
+    def configuration(self, resource):
+        """Returns the indexed configuration matching the translated resource, if any"""
+        with self._lock:
+            return self.configurations.get((resource.get('name'), resource.get('serial_number') or None))
+
+    def index_configuration(self, configuration):
+        name = configuration.get_attribute('name')
+        serial_number = configuration.get_attribute('serial_number') or None
+        with self._lock:
+            self.configurations[(name, serial_number)] = configuration
+            # Resources without a serial number are matched on name alone
+            self.configurations.setdefault((name, None), configuration)
+
+
+class SyncDaemon(object):
+    """Processes queued resource updates against warm caches until stopped"""
+
+    def __init__(self, cache, resources, import_locations=False, reconcile_interval=RECONCILE_INTERVAL):
+        self.cache = cache
+        self.resources = resources
+        self.engine = importers.engine.ImportEngine(cache=cache, import_locations=import_locations)
+        self.reconcile_interval = reconcile_interval
+        self.queue = WorkQueue()
+        self.started_at = None
+        self.last_reconcile_at = None
+        self.processed = 0
+        self.unchanged = 0
+        self.failed = 0
+        # Updates that failed to sync, waiting to be queued again
+        self._retries = []
+        self._attempts = {}
+        self._retry_counter = itertools.count()
+        # Failures to refresh the caches or reconcile, rather than to sync one resource
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.last_error_at = None
+        self._stopped = threading.Event()
+
+    def enqueue_event(self, event):
+        """Queues an update from an EC2 state-change event or a {"resource": ..., "id": ...} event"""
+        if not isinstance(event, dict):
+            raise SyncDaemonError('Events must be JSON objects')
+        detail = event.get('detail') or {}
+        if detail.get('instance-id'):
+            resource, resource_id = 'ec2', detail['instance-id']
+        else:
+            resource, resource_id = event.get('resource'), event.get('id')
+        if resource not in importers.registry.RESOURCE_TYPES or not resource_id:
+            raise SyncDaemonError('Events must be an EC2 state-change event or have a supported resource and an id')
+        return self.queue.put(resource, resource_id, EVENT_PRIORITY)
+
+    def reconcile(self):
+        """Queues every resource with the data it was collected with, so none of them is fetched twice"""
+        self.cache.refresh()
+        for resource in self.resources:
+            resource_type = importers.registry.get_resource_type(resource)
+            for data in resource_type.collect():
+                self.queue.put(resource, resource_type.resource_id(data), RECONCILE_PRIORITY, data=data)
+        self.last_reconcile_at = time.time()
+
+    def run(self):
+        self.started_at = time.time()
+        while not self._stopped.is_set():
+            try:
+                if not self.cache.loaded_at:
+                    self.cache.refresh(force=True)
+                if self._reconcile_due():
+                    self.reconcile()
+                self.cache.refresh()
+            except Exception:
+                # AWS or IT Glue being unreachable should not stop the daemon
+                logger.exception('Failed to refresh caches or reconcile')
+                self._record_error()
+                self._stopped.wait(self._backoff())
+                continue
+            self.consecutive_errors = 0
+            self._requeue_due_retries()
+            batch = self.queue.get_batch(timeout=1, limit=self.engine.batch_size)
+            if batch:
+                self.process(batch)
+
+    def process(self, batch):
+        """Syncs a batch of queued updates of one resource type, queueing the failed ones for a retry"""
+        resource, _, priority, _ = batch[0]
+        resource_ids = [resource_id for _, resource_id, _, _ in batch]
+        resource_type = importers.registry.get_resource_type(resource)
+        try:
+            resources = [data for _, _, _, data in batch if data is not None]
+            unfetched = [resource_id for _, resource_id, _, data in batch if data is None]
+            if unfetched:
+                resources.extend(resource_type.fetch(unfetched))
+            # A reconcile goes over every resource, so only the ones that differ from IT Glue are sent
+            result = self.engine.import_resources(resource, resources, skip_unchanged=priority == RECONCILE_PRIORITY)
+        except Exception:
+            logger.exception('Failed to sync %s %s', resource, resource_ids)
+            failed = resource_ids
+            missing = []
+        else:
+            failed = result['failed']
+            found = set(resource_type.resource_id(data) for data in resources)
+            missing = [resource_id for resource_id in resource_ids if resource_id not in found]
+            self.unchanged += result['unchanged']
+        for resource_id in missing:
+            logger.warning('%s %s no longer exists in AWS', resource, resource_id)
+        for resource_id in failed:
+            self._retry_later(resource, resource_id, priority)
+        self.failed += len(failed) + len(missing)
+        self.processed += len(resource_ids) - len(failed) - len(missing)
+        for resource_id in set(resource_ids) - set(failed):
+            self._attempts.pop((resource, resource_id), None)
+
+    def stop(self):
+        self._stopped.set()
+
+    def health(self):
+        if self._stopped.is_set():
+            status = 'stopped'
+        elif self.consecutive_errors:
+            status = 'degraded'
+        elif self.cache.loaded_at:
+            status = 'ok'
+        else:
+            status = 'starting'
+        return {
+            'status': status,
+            'uptime_seconds': int(time.time() - self.started_at) if self.started_at else 0,
+            'last_error_at': self.last_error_at
+        }
+
+    def metrics(self):
+        return {
+            'processed': self.processed,
+            'unchanged': self.unchanged,
+            'failed': self.failed,
+            'retrying': len(self._retries),
+            'errors': self.errors,
+            'consecutive_errors': self.consecutive_errors,
+            'coalesced': self.queue.coalesced,
+            'queue_depth': self.queue.depth(),
+            'cached_configurations': len(getattr(self.cache, 'configurations', {})),
+            'cache_loaded_at': self.cache.loaded_at,
+            'last_reconcile_at': self.last_reconcile_at
+        }
+
+    def _retry_later(self, resource, resource_id, priority):
+        key = (resource, resource_id)
+        attempts = self._attempts.get(key, 0) + 1
+        if attempts > MAX_RETRIES:
+            # The next reconcile picks the resource up again
+            logger.error('Giving up on %s %s after %s attempts', resource, resource_id, MAX_RETRIES)
+            del self._attempts[key]
+            return
+        self._attempts[key] = attempts
+        retry_at = time.time() + min(MAX_BACKOFF, 2 ** attempts)
+        heapq.heappush(self._retries, (retry_at, next(self._retry_counter), resource, resource_id, priority))
+
+    def _requeue_due_retries(self):
+        while self._retries and self._retries[0][0] <= time.time():
+            _, _, resource, resource_id, priority = heapq.heappop(self._retries)
+            self.queue.put(resource, resource_id, priority)
+
+    def _record_error(self):
+        self.errors += 1
+        self.consecutive_errors += 1
+        self.last_error_at = time.time()
+
+    def _backoff(self):
+        return min(MAX_BACKOFF, 2 ** self.consecutive_errors)
+
+    def _reconcile_due(self):
+        if not self.reconcile_interval:
+            return False
+        return self.last_reconcile_at is None or time.time() - self.last_reconcile_at >= self.reconcile_interval
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def make_request_handler(daemon):
+    class SyncDaemonRequestHandler(BaseHTTPRequestHandler):
+        """GET /health and /metrics report on the daemon, POST /events queues an update"""
+
+        def do_GET(self):
+            if self.path == '/health':
+                self._send_json(200, daemon.health())
+            elif self.path == '/metrics':
+                self._send_json(200, daemon.metrics())
+            else:
+                self._send_json(404, {'error': 'Not found'})
+
+        def do_POST(self):
+            if self.path != '/events':
+                return self._send_json(404, {'error': 'Not found'})
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                event = json.loads(self.rfile.read(length))
+                queued = daemon.enqueue_event(event)
+            except (ValueError, SyncDaemonError) as error:
+                return self._send_json(400, {'error': str(error)})
+            self._send_json(202, {'queued': queued})
+
+        def log_message(self, format, *args):
+            logger.debug(format, *args)
+
+        def _send_json(self, status, body):
+            payload = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    return SyncDaemonRequestHandler
+
+
+# Command-line functions
+def main():
+    args = get_args()
+    logging.basicConfig(level='INFO')
+    cache = SyncCache(args.organization, ttl=args.cache_ttl)
+    daemon = SyncDaemon(
+        cache,
+        args.resources,
+        import_locations=args.import_locations,
+        reconcile_interval=args.reconcile_interval
+    )
+    server = ThreadingHTTPServer((args.host, args.port), make_request_handler(daemon))
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+    logger.info('Listening on %s:%s', args.host, args.port)
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        daemon.stop()
+    finally:
+        server.shutdown()
+    return True
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description='Keep IT Glue Configurations in sync with AWS from a long-running process')
+    parser.add_argument(
+        'organization',
+        metavar='ORG_ID_OR_NAME',
+        type=str,
+        help='The ID or NAME of the parent organization'
+    )
+    parser.add_argument(
+        '-r', '--resources',
+        nargs='+',
+        choices=sorted(importers.registry.RESOURCE_TYPES),
+        default=sorted(importers.registry.RESOURCE_TYPES),
+        help='Resources to include in the periodic reconcile'
+    )
+    parser.add_argument(
+        '-il', '--import-locations',
+        action='store_true',
+        help='Import EC2 placements as IT Glue Locations'
+    )
+    parser.add_argument(
+        '--reconcile-interval',
+        type=int,
+        default=RECONCILE_INTERVAL,
+        help='Seconds between full reconcile sweeps, 0 disables them'
+    )
+    parser.add_argument(
+        '--cache-ttl',
+        type=int,
+        default=CACHE_TTL,
+        help='Seconds before the IT Glue caches are reloaded'
+    )
+    parser.add_argument(
+        '--host',
+        type=str,
+        default='127.0.0.1',
+        help='Address for the health, metrics and events endpoint'
+    )
+    parser.add_argument(
+        '--port',
+        type=int,
+        default=DEFAULT_PORT,
+        help='Port for the health, metrics and events endpoint'
+    )
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main()